@@ -2,32 +2,33 @@
 # This file creates and trains our anomaly detection model
 # We use Isolation Forest because it's good at finding unusual points
 # and it doesn't need us to tell it exactly what is bad
+# There is also a much lighter rule-based model (z-score per feature)
+# that can be used instead of the forest
+# Optionally the trained forest is compiled to native code (treelite + tl2cgen)
+# so the live loop can score much faster than scikit-learn does
 
+import os
+import tempfile
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 import numpy as np
 
-def train_ai_model(training_features, contamination=0.02):
-    # Convert our list of measurements into a nice table (DataFrame)
+try:
+    import treelite
+    import tl2cgen
+except ImportError:     # optional - without them we simply score with scikit-learn
+    treelite = tl2cgen = None
+
+def describe_training_data(training_features):
+    """
+    Make a nice table (DataFrame) of the training array, for reporting and saving,
+    plus the important numbers we use later to explain why something is strange.
+    """
     df = pd.DataFrame(
         training_features,
         columns=["Voltage", "DeltaVoltage", "NoiseStd", "Temperature"]
-    )
-
-    # Create the anomaly detection model
-    # n_estimators = how many small decision trees we use (more = better but slower)
-    # contamination = how much weird data we expect (0.02 = 2%)
-    model = IsolationForest(
-        n_estimators=200,
-        contamination=contamination,
-        random_state=42         # same random seed = same results every time
-    )
+    ).astype({"Voltage": "int64", "DeltaVoltage": "int64", "Temperature": "int64"})
 
-    # Teach the model what "normal" looks like
-    model.fit(df)
-
-    # Save some important numbers from the training data
-    # We will use these later to explain why something is strange
     baseline = {
         "mean_delta": df["DeltaVoltage"].mean(),
         "std_delta": df["DeltaVoltage"].std(),
@@ -39,4 +40,187 @@ def train_ai_model(training_features, contamination=0.02):
         "max_temp": df["Temperature"].max()
     }
 
-    return model, baseline, df
\ No newline at end of file
+    return df, baseline
+
+
+def train_ai_model(training_features, contamination=0.02, n_jobs=None):
+    # training_features is a NumPy array with one row per measurement.
+    # The model learns straight from the array; the DataFrame is only for reporting.
+    df, baseline = describe_training_data(training_features)
+
+    # Create the anomaly detection model
+    # n_estimators = how many small decision trees we use (more = better but slower)
+    # contamination = how much weird data we expect (0.02 = 2%)
+    # n_jobs = how many CPU cores build the trees (-1 = all of them)
+    model = IsolationForest(
+        n_estimators=200,
+        contamination=contamination,
+        random_state=42,        # same random seed = same results every time
+        n_jobs=n_jobs
+    )
+
+    # Teach the model what "normal" looks like
+    # (a float32 array is what the trees use inside, so no extra copy is made)
+    model.fit(training_features)
+
+    return model, baseline, df
+
+
+class RuleModel:
+    """
+    Simple and very fast alternative to the Isolation Forest:
+    a sample is strange if any of the 4 features is more than z_limit
+    standard deviations away from its training mean.
+    Has the same decision_function() as the scikit-learn model,
+    so score_batch() can use either one.
+    """
+
+    def __init__(self, mean, std, z_limit):
+        self.mean = mean
+        self.std = std
+        self.z_limit = z_limit
+
+    def decision_function(self, features):
+        # how many standard deviations away is each feature?
+        # (a feature that never changed in training has std 0: any change is infinitely far)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.abs(features - self.mean) / self.std
+        z = np.nan_to_num(z, nan=0.0, posinf=np.inf)
+
+        # negative = at least one feature is outside its limit, like the forest's score
+        return self.z_limit - z.max(axis=1)
+
+    def limits(self):
+        """
+        The same limits as plain numbers: (low, high) arrays with one entry
+        per feature, so alerts can say which feature is outside.
+        """
+        return self.mean - self.z_limit * self.std, self.mean + self.z_limit * self.std
+
+
+def train_rule_model(training_features, z_limit=3.0):
+    """
+    Learn the mean and standard deviation of every feature from the training data.
+    Returns the same (model, baseline, df) as train_ai_model.
+    """
+    df, baseline = describe_training_data(training_features)
+
+    features = training_features.astype(np.float64)
+    model = RuleModel(features.mean(axis=0), features.std(axis=0), z_limit)
+
+    return model, baseline, df
+
+
+def score_batch(model, features):
+    """
+    Score many samples with one model call.
+    Returns: scores (negative = strange) and a True/False anomaly flag per row.
+    """
+    # decision_function already subtracts model.offset_, so the model's own
+    # predict() says -1 exactly when the score is below 0.
+    # Using only this one call means the trees are walked once, not twice.
+    scores = model.decision_function(features)
+    return scores, scores < 0
+
+
+class CompiledForest:
+    """
+    The trained forest as a native shared library.
+    Has the same decision_function() as the scikit-learn model,
+    so score_batch() can use either one.
+    """
+
+    def __init__(self, predictor, scale, shift):
+        self.predictor = predictor
+        self.scale = scale
+        self.shift = shift
+
+    def decision_function(self, features):
+        raw = self.predictor.predict(tl2cgen.DMatrix(features)).reshape(-1)
+        return self.scale * raw + self.shift
+
+
+def compile_model(model, training_features, libpath):
+    """
+    Compile the trained Isolation Forest into a shared library (libpath).
+    A library left by an earlier run is reused if it loads and still gives the
+    same scores; a broken one (half-written, other tl2cgen version, ...) is
+    deleted and built again.
+    Returns: a CompiledForest, or None if treelite/tl2cgen are not installed,
+    the build fails (e.g. no gcc) or the compiled scores don't match scikit-learn.
+    """
+    if treelite is None or tl2cgen is None:
+        return None
+
+    libpath = os.path.abspath(libpath)
+    stamp = libpath + ".size"
+    if _build_finished(libpath, stamp):
+        try:
+            compiled = _load_compiled(libpath, model, training_features)
+        except Exception:
+            compiled = None
+        if compiled is not None:
+            return compiled
+
+    # whatever is there is unusable - build a new one
+    for path in (libpath, stamp):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # build next to the final file and only rename it into place when done,
+    # so an interrupted build never leaves a half-written library at libpath
+    # (loading one of those can crash the whole process, not just raise an error)
+    partial = libpath + ".part"
+    try:
+        tl_model = treelite.sklearn.import_model(model)
+        dmat = tl2cgen.DMatrix(training_features)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # record which way each branch usually goes on normal data,
+            # so the compiler can lay out the common path first
+            annotation = os.path.join(tmp, "branches.json")
+            tl2cgen.annotate_branch(model=tl_model, dmat=dmat, path=annotation)
+            tl2cgen.export_lib(
+                model=tl_model,
+                toolchain="gcc",
+                libpath=partial,
+                params={"parallel_comp": os.cpu_count(), "annotate_in": annotation}
+            )
+        os.replace(partial, libpath)
+
+        compiled = _load_compiled(libpath, model, training_features)
+    except Exception:
+        # e.g. no working C compiler - the caller falls back to sklearn
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
+
+    if compiled is not None:
+        # remember that this library was written completely
+        with open(stamp, "w") as f:
+            f.write(str(os.path.getsize(libpath)))
+    return compiled
+
+
+def _build_finished(libpath, stamp):
+    """True if libpath exists and has the size recorded right after it was built."""
+    try:
+        with open(stamp) as f:
+            return int(f.read()) == os.path.getsize(libpath)
+    except (OSError, ValueError):
+        return False
+
+
+def _load_compiled(libpath, model, training_features):
+    """Load a compiled library and line its scores up with the sklearn model."""
+    predictor = tl2cgen.Predictor(libpath)
+
+    # The library returns its own kind of score (a sign/offset away from sklearn's).
+    # Line it up once with decision_function on the training data.
+    raw = predictor.predict(tl2cgen.DMatrix(training_features)).reshape(-1)
+    expected = model.decision_function(training_features)
+    scale, shift = np.polyfit(raw, expected, 1)
+    if not np.allclose(scale * raw + shift, expected, atol=1e-6):
+        return None
+
+    return CompiledForest(predictor, scale, shift)
@@ -4,20 +4,21 @@
 
 import struct
 
+# The frame layout, prepared once instead of on every packet:
+# < = little endian, I = 4-byte unsigned int (CAN id), B = 1-byte unsigned (DLC)
+# then the first 4 payload bytes one by one: voltage high, voltage low, temperature, status
+# (the last 4 payload bytes are unused, so we don't read them at all)
+_FRAME = struct.Struct("<IB4B")
+
 def parse_can_frame(data):
     """
     Take 13 bytes from the gateway and turn them into useful numbers.
     Returns: can_id, voltage (in mV), temperature (°C), status
     """
-    # unpack the 13 bytes using this format:
-    # < = little endian, I = 4-byte unsigned int, B = 1-byte unsigned
-    # 8s = 8 bytes of payload
-    can_id, dlc, payload = struct.unpack("<IB8s", data)
+    # unpack_from reads straight out of the buffer, so memoryviews work without a copy
+    can_id, dlc, volt_hi, volt_lo, temperature, status = _FRAME.unpack_from(data, 0)
 
     # voltage is stored in two bytes (high byte and low byte)
-    voltage_mv = (payload[0] << 8) | payload[1]     # combine to 16-bit number
-
-    temperature = payload[2]                        # 1 byte = temperature
-    status = payload[3]                             # 1 byte = status code
+    voltage_mv = (volt_hi << 8) | volt_lo      # combine to 16-bit number
 
     return can_id, voltage_mv, temperature, status
\ No newline at end of file
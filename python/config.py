@@ -6,6 +6,15 @@
 UDP_IP = "127.0.0.1"        # localhost
 UDP_PORT = 5000             # port number we chose
 
+# Kernel receive buffer for the UDP socket - a big buffer means bursts
+# are queued instead of silently dropped while we are busy.
+# Linux caps this at net.core.rmem_max, so you may need:
+#   sudo sysctl -w net.core.rmem_max=12582912
+UDP_RCVBUF_SIZE = 12 * 1024 * 1024   # 12 MB
+
+# Parsed frames wait here between the receive thread and the main loop
+FRAME_QUEUE_SIZE = 10000    # if the main loop falls this far behind, new frames are dropped
+
 # How much data we collect for learning "normal" behavior
 TRAINING_SAMPLES = 200      # number of good examples to learn from
 
@@ -15,9 +24,45 @@ WINDOW_SIZE = 20
 # How much "strange" data we expect (small number = sensitive)
 CONTAMINATION = 0.02        # 2% is a common starting value
 
+# Which model watches the live data:
+# False = simple rule-based model (each feature within RULE_Z_LIMIT standard deviations
+#         of what we saw in training) - very fast, no scikit-learn in the live loop
+# True  = Isolation Forest (learns combinations of features, heavier)
+USE_ISOLATION_FOREST = False
+RULE_Z_LIMIT = 3.0          # how many standard deviations count as "strange"
+
+# How many CPU cores the model may use (-1 = all of them)
+N_JOBS = -1
+
+# Compile the trained Isolation Forest to native code for faster live scoring
+# (only used when USE_ISOLATION_FOREST = True). Needs the optional packages
+#   pip install treelite tl2cgen
+# and gcc on the PATH. Without them we print a note and score with scikit-learn.
+USE_COMPILED_MODEL = True
+COMPILED_MODEL_PATH = "isolation_forest_{key}.so"
+
+# Reuse the model trained by an earlier run with the same settings
+# ({key} is filled with a hash of the settings that change what the model learns)
+# The file is not checked against the live data: if the sensor's normal behavior
+# changes, delete it (or set this to False) so the model is trained again.
+REUSE_TRAINED_MODEL = True
+MODEL_CACHE_FILE = "baseline_{key}.pkl"
+
 # How many anomalies in a row we need to raise a real alert
 ANOMALY_WINDOW = 10         # look at last 10 measurements
 ANOMALY_THRESHOLD = 3       # need at least 3 anomalies to alert
 
+# Print every normal ("OK") sample? Off = only a summary every OK_SUMMARY_EVERY samples
+VERBOSE_OK = False
+OK_SUMMARY_EVERY = 100
+
+# Live scoring is done in small batches so the model is called less often
+SCORE_BATCH_SIZE = 32       # score at most this many samples in one call
+SCORE_FLUSH_TIMEOUT = 0.05  # a partial batch is scored once its oldest sample is this old (seconds)
+
 # How long we monitor and record in live mode (in seconds)
-COLLECTION_TIME = 3 * 60   # 3 minutes = 180 seconds
\ No newline at end of file
+COLLECTION_TIME = 3 * 60   # 3 minutes = 180 seconds
+
+# Where live measurements are written, and how often the file is flushed to disk
+LIVE_LOG_FILE = "live_monitoring_log.csv"
+LOG_FLUSH_INTERVAL = 1.0    # seconds
\ No newline at end of file
@@ -0,0 +1,96 @@
+# features.py
+# This file turns the stream of voltages into the features the AI looks at:
+# the change since the last sample (delta) and the rolling noise level.
+# It is written so each new sample costs the same small amount of work,
+# no matter how big WINDOW_SIZE is.
+# If numba is installed the per-sample math is compiled to machine code;
+# without it the exact same code simply runs as normal Python.
+
+import math
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that leaves the function as it is."""
+        return lambda func: func
+
+# positions inside the state arrays
+_HEAD, _COUNT, _PREV, _HAS_PREV = range(4)     # integer state
+_MEAN, _M2 = range(2)                          # float state
+
+
+@njit(cache=True)
+def _step(buf, istate, fstate, voltage):
+    """
+    Handle one new voltage. buf is the ring buffer of the last voltages,
+    istate holds [head, count, prev_voltage, has_prev] and
+    fstate holds [mean, M2] (Welford's running mean and sum of squared differences).
+    Returns: ready (False for the very first sample), delta_v, noise_std
+    """
+    if istate[_HAS_PREV] == 0:
+        # first sample: nothing to compare with yet
+        istate[_PREV] = voltage
+        istate[_HAS_PREV] = 1
+        return False, 0, 0.0
+
+    delta_v = voltage - istate[_PREV]
+    istate[_PREV] = voltage
+
+    size = len(buf)
+    head = istate[_HEAD]
+    mean = fstate[_MEAN]
+    if istate[_COUNT] == size:
+        # window is full: the new voltage replaces the oldest one
+        # (Welford add and remove done in one update, so it can't drift on long runs)
+        old = buf[head]
+        diff = voltage - old
+        new_mean = mean + diff / size
+        fstate[_M2] = max(fstate[_M2] + diff * (voltage - new_mean + old - mean), 0.0)
+    else:
+        # window still filling up: plain Welford add
+        istate[_COUNT] += 1
+        diff = voltage - mean
+        new_mean = mean + diff / istate[_COUNT]
+        fstate[_M2] += diff * (voltage - new_mean)
+    fstate[_MEAN] = new_mean
+
+    buf[head] = voltage
+    istate[_HEAD] = (head + 1) % size
+
+    noise_std = math.sqrt(fstate[_M2] / istate[_COUNT])
+    return True, delta_v, noise_std
+
+
+class FeatureExtractor:
+    """
+    Keeps the previous voltage and a fixed-size ring buffer of the last
+    voltages, with a running mean and M2 (Welford), so delta and noise
+    (population std, like np.std) are updated in O(1) per sample.
+    """
+
+    def __init__(self, window_size):
+        if HAVE_NUMBA:
+            # compiled code wants real arrays, allocated once and reused forever
+            self.buf = np.zeros(window_size, dtype=np.int64)
+            self.istate = np.zeros(4, dtype=np.int64)
+            self.fstate = np.zeros(2, dtype=np.float64)
+        else:
+            # plain Python is fastest with plain lists
+            self.buf = [0] * window_size
+            self.istate = [0] * 4
+            self.fstate = [0.0] * 2
+
+    def update(self, voltage):
+        """
+        Add one voltage.
+        Returns: (delta_v, noise_std), or None for the very first sample
+        """
+        ready, delta_v, noise_std = _step(self.buf, self.istate, self.fstate, voltage)
+        if not ready:
+            return None
+        return delta_v, noise_std
@@ -5,17 +5,27 @@
 # 3. watch live and look for problems
 # 4. save everything so we can look at it later
 
+import csv
+import hashlib
+import queue
 import socket
 import time
 import warnings
+from collections import deque
+import joblib
 import numpy as np
-import pandas as pd
+
+try:
+    from sklearn.exceptions import InconsistentVersionWarning
+except ImportError:     # scikit-learn older than 1.3 warns with a plain UserWarning
+    InconsistentVersionWarning = UserWarning
 
 # Our own modules
 from config import *
-from can_parser import parse_can_frame
-from ai_model import train_ai_model
-from monitor import explain_anomaly, ai_recommendation
+from ai_model import train_ai_model, train_rule_model, score_batch, compile_model
+from monitor import explain_anomaly, ai_recommendation, make_thresholds
+from features import FeatureExtractor
+from udp_receiver import FrameReader
 
 # Hide some boring warnings from libraries
 warnings.filterwarnings("ignore")
@@ -23,124 +33,255 @@ warnings.filterwarnings("ignore")
 # Create UDP socket to listen for data from gateway
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 sock.bind((UDP_IP, UDP_PORT))
+try:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_SIZE)
+except OSError:
+    pass    # e.g. macOS refuses sizes above kern.ipc.maxsockbuf - keep the default, warn below
 print(f"AI Monitor started - listening on {UDP_IP}:{UDP_PORT}")
 
-# =============================================
-# Phase 1: Learn normal behavior (training)
-# =============================================
-print("\nPhase 1: Collecting normal data to learn from...")
-print(f"Need {TRAINING_SAMPLES} good measurements...")
-
-training_features = []
-voltage_window = []         # will keep last few voltages to calculate noise
-prev_voltage = None
-
-while len(training_features) < TRAINING_SAMPLES:
-    data, addr = sock.recvfrom(1024)
-    
-    if len(data) != 13:
-        continue  # skip bad packets
-
-    # read the values from the packet
-    _, voltage, temp, _ = parse_can_frame(data)
-
-    if prev_voltage is not None:
-        delta_v = voltage - prev_voltage
-        
-        # keep only the last WINDOW_SIZE voltages
-        voltage_window.append(voltage)
-        if len(voltage_window) > WINDOW_SIZE:
-            voltage_window.pop(0)
-        
-        # calculate how noisy the signal is right now
-        noise_std = np.std(voltage_window) if len(voltage_window) > 1 else 0.0
-        
-        # save this example for training
-        training_features.append([voltage, delta_v, noise_std, temp])
-
-    prev_voltage = voltage
-
-print(f"Collected {len(training_features)} examples → training done")
+# Linux reports double the value (bookkeeping) and silently caps it at rmem_max
+rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+if rcvbuf < UDP_RCVBUF_SIZE:
+    print(f"Warning: UDP receive buffer is only {rcvbuf} bytes "
+          f"(wanted {UDP_RCVBUF_SIZE}) - raise net.core.rmem_max "
+          f"(kern.ipc.maxsockbuf on macOS) to avoid drops")
 
-# =============================================
-# Phase 2: Train the AI model
-# =============================================
-print("\nPhase 2: Training AI model...")
-print("\n... Please wait for few second: ~20 Sec. - Collecting 200 Samples")
-model, baseline, df_training = train_ai_model(training_features, CONTAMINATION)
-df_training.to_csv("training_data.csv", index=False)
+# A separate thread keeps emptying the socket and hands us parsed frames,
+# so printing or a slow model call never makes the kernel drop packets
+frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+reader = FrameReader(sock, frame_queue)
+reader.start()
+
+# A model trained with the same settings can be reused from an earlier run.
+# The settings that change what the model learns are hashed into the file name,
+# so changing any of them automatically means training again.
+# (RULE_Z_LIMIT is not one of them: it is only applied when scoring.)
+# Note: the cache can't tell if the sensor's *normal* behavior has changed
+# since it was made - delete the file (or set REUSE_TRAINED_MODEL = False) to retrain.
+settings = f"{TRAINING_SAMPLES}:{WINDOW_SIZE}:{CONTAMINATION}:{USE_ISOLATION_FOREST}"
+cache_key = hashlib.md5(settings.encode(), usedforsecurity=False).hexdigest()   # just a name, not security
+cache_file = MODEL_CACHE_FILE.format(key=cache_key)
+
+trained = False
+if REUSE_TRAINED_MODEL:
+    try:
+        # a model saved by another scikit-learn version may not behave the same,
+        # so treat that warning as an error instead of letting it be hidden
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", InconsistentVersionWarning)
+            model, baseline, df_training = joblib.load(cache_file)
+        training_features = df_training.to_numpy(dtype=np.float32)
+        if not USE_ISOLATION_FOREST:
+            model.z_limit = RULE_Z_LIMIT    # use today's setting, not the saved one
+        trained = True
+        print(f"\nLoaded trained model from {cache_file} - skipping Phase 1 and 2")
+    except FileNotFoundError:
+        pass
+    except Exception as err:
+        # damaged file, old format, other library version, ...
+        print(f"\nSaved model {cache_file} is unusable ({type(err).__name__}) - retraining")
+
+if not trained:
+    # =============================================
+    # Phase 1: Learn normal behavior (training)
+    # =============================================
+    print("\nPhase 1: Collecting normal data to learn from...")
+    print(f"Need {TRAINING_SAMPLES} good measurements...")
+
+    # one row per example: voltage, delta_v, noise_std, temp (filled in as data arrives)
+    training_features = np.empty((TRAINING_SAMPLES, 4), dtype=np.float32)
+    collected = 0
+    extractor = FeatureExtractor(WINDOW_SIZE)   # keeps last voltage + last few voltages for noise
+
+    while collected < TRAINING_SAMPLES:
+        # read the values from the next packet (waits until one arrives)
+        try:
+            _, _, voltage, temp, _ = frame_queue.get(timeout=1.0)
+        except queue.Empty:
+            if not reader.is_alive():
+                raise SystemExit(f"UDP receiver stopped ({reader.error}) - no data to learn from")
+            continue
+
+        # change since last sample + how noisy the signal is right now
+        # (nothing yet for the very first sample)
+        features = extractor.update(voltage)
+        if features is not None:
+            delta_v, noise_std = features
+
+            # save this example for training
+            training_features[collected] = (voltage, delta_v, noise_std, temp)
+            collected += 1
+
+    print(f"Collected {collected} examples → training done")
+
+    # =============================================
+    # Phase 2: Train the AI model
+    # =============================================
+    print("\nPhase 2: Training AI model...")
+    print("\n... Please wait for few second: ~20 Sec. - Collecting 200 Samples")
+    if USE_ISOLATION_FOREST:
+        model, baseline, df_training = train_ai_model(training_features, CONTAMINATION, N_JOBS)
+    else:
+        model, baseline, df_training = train_rule_model(training_features, RULE_Z_LIMIT)
+    df_training.to_csv("training_data.csv", index=False)
+
+    # remember the result so the next run can skip Phase 1 and 2
+    joblib.dump((model, baseline, df_training), cache_file)
+
+# the live loop scores with this - the compiled model if we can, else the normal one
+scorer = model
+if USE_ISOLATION_FOREST and USE_COMPILED_MODEL:
+    print("Preparing compiled model for faster scoring...")
+    compiled = compile_model(model, training_features, COMPILED_MODEL_PATH.format(key=cache_key))
+    if compiled is not None:
+        scorer = compiled
+    else:
+        print("Compiled model not available - scoring with scikit-learn")
 print("Model ready! Normal behavior learned.")
 
+# limits used to explain alerts - computed once here, not on every alert
+# (the rule model's own limits, so its alerts name the feature it flagged)
+thresholds = make_thresholds(baseline, None if USE_ISOLATION_FOREST else model)
+
 # =============================================
 # Phase 3: Live monitoring & anomaly detection
 # =============================================
 print("\nPhase 3: Starting live monitoring...")
 print("Press Ctrl+C to stop early")
 
-data_log = []
-voltage_window = []         # reset window for live phase
-prev_voltage = None
-anomaly_history = []        # remember last few anomaly decisions
+# every measurement goes straight to the CSV file, so memory stays flat on long runs
+# (the file is only opened once the first result is ready, so a run that
+# records nothing doesn't wipe out the log of the previous run)
+log_file = None
+log_writer = None
+logged_count = 0
+last_flush = time.time()
 
-start_time = time.time()
+extractor = FeatureExtractor(WINDOW_SIZE)   # fresh window for live phase
+anomaly_history = deque(maxlen=ANOMALY_WINDOW)   # remember last few anomaly decisions
+anomaly_count = 0           # how many of those are anomalies (kept up to date as we go)
+ok_count = 0                # how many samples were fine
 
-try:
-    while time.time() - start_time < COLLECTION_TIME:
-        data, _ = sock.recvfrom(1024)
-        if len(data) != 13:
-            continue
+# samples wait here until we have enough to ask the model about all of them at once
+feat_batch = np.empty((SCORE_BATCH_SIZE, 4), dtype=np.float32)
+pending = []                # (time received, voltage, delta_v, noise_std, temp) for each row
+batch_started = 0.0         # when the oldest waiting row was taken from the queue
 
-        _, voltage, temp, _ = parse_can_frame(data)
 
-        if prev_voltage is not None:
-            delta_v = voltage - prev_voltage
+def score_pending():
+    """
+    Ask the model about all waiting samples in one call,
+    then handle the answers one by one in arrival order.
+    """
+    global anomaly_count, ok_count, logged_count, last_flush, log_file, log_writer
+    scores, anomalies = score_batch(scorer, feat_batch[:len(pending)])
 
-            voltage_window.append(voltage)
-            if len(voltage_window) > WINDOW_SIZE:
-                voltage_window.pop(0)
+    # take the rows out before handling them, so a Ctrl+C in the middle
+    # can't make the shutdown code handle (and log) the same rows again
+    rows = pending[:]
+    pending.clear()
 
-            noise_std = np.std(voltage_window) if len(voltage_window) > 1 else 0.0
+    for (t, voltage, delta_v, noise_std, temp), is_anomaly in zip(rows, anomalies):
+        is_anomaly = bool(is_anomaly)
 
-            # ask the model: is this normal or strange?
-            sample = [[voltage, delta_v, noise_std, temp]]
-            is_anomaly = model.predict(sample)[0] == -1   # -1 means anomaly
+        # keep history to avoid single false alarms
+        # (a full deque drops its oldest entry by itself, so take that one out of the count)
+        if len(anomaly_history) == ANOMALY_WINDOW and anomaly_history[0]:
+            anomaly_count -= 1
+        anomaly_history.append(is_anomaly)
+        anomaly_count += is_anomaly
 
-            # keep history to avoid single false alarms
-            anomaly_history.append(is_anomaly)
-            if len(anomaly_history) > ANOMALY_WINDOW:
-                anomaly_history.pop(0)
-
-            # only alert if anomaly appears multiple times
-            if sum(anomaly_history) >= ANOMALY_THRESHOLD:
-                reason = explain_anomaly(voltage, delta_v, noise_std, temp, baseline)
-                action = ai_recommendation(reason)
-                print(f"[ALERT!] {reason} → {action}")
-                print(f"   Voltage = {voltage} mV  Noise={noise_std:5.2f}  Temp = {temp} °C")
-            else:
+        # only alert if anomaly appears multiple times
+        if anomaly_count >= ANOMALY_THRESHOLD:
+            reason = explain_anomaly(voltage, delta_v, noise_std, temp, thresholds)
+            action = ai_recommendation(reason)
+            print(f"[ALERT!] {reason} → {action}")
+            print(f"   Voltage = {voltage} mV  Noise={noise_std:5.2f}  Temp = {temp} °C")
+        else:
+            # printing every normal sample costs more than checking it, so by default
+            # only show a short summary now and then (alerts are always printed)
+            ok_count += 1
+            if VERBOSE_OK:
                 print(f"OK - V={voltage:4d} mV  ΔV={delta_v:+4d}  Noise={noise_std:5.2f}")
+            elif ok_count % OK_SUMMARY_EVERY == 0:
+                print(f"OK - {ok_count} normal samples so far, last V={voltage:4d} mV  Noise={noise_std:5.2f}")
+
+        # save everything for later plotting / analysis
+        if log_writer is None:
+            log_file = open(LIVE_LOG_FILE, "w", newline="")
+            log_writer = csv.writer(log_file)
+            log_writer.writerow(["Time", "Voltage", "DeltaVoltage", "NoiseStd", "Temperature", "Anomaly"])
+        log_writer.writerow((t, voltage, delta_v, noise_std, temp, is_anomaly))
+        logged_count += 1
+
+    # push the rows to disk now and then, not on every single write
+    now = time.time()
+    if now - last_flush >= LOG_FLUSH_INTERVAL:
+        log_file.flush()
+        last_flush = now
+
 
-            # save everything for later plotting / analysis
-            data_log.append({
-                "Time": time.time() - start_time,
-                "Voltage": voltage,
-                "DeltaVoltage": delta_v,
-                "NoiseStd": noise_std,
-                "Temperature": temp,
-                "Anomaly": is_anomaly
-            })
+# Frames kept arriving while we trained / loaded / compiled the model.
+# They are old news now, so Phase 3 skips everything received before this moment
+# (and drops while the queue was full of them don't count as falling behind).
+start_time = time.time()
+dropped_before = reader.dropped
+
+try:
+    while time.time() - start_time < COLLECTION_TIME:
+        # never let the oldest waiting row wait longer than SCORE_FLUSH_TIMEOUT
+        if pending:
+            wait = max(SCORE_FLUSH_TIMEOUT - (time.time() - batch_started), 0.0)
+        else:
+            wait = SCORE_FLUSH_TIMEOUT
+        try:
+            received, _, voltage, temp, _ = frame_queue.get(timeout=wait)
+        except queue.Empty:
+            # the oldest row has waited long enough - score what we have
+            if pending:
+                score_pending()
+            if not reader.is_alive():
+                print(f"\nUDP receiver stopped ({reader.error}) - ending live monitoring")
+                break
+            continue
 
-        prev_voltage = voltage
+        if received < start_time:
+            continue    # left over from before Phase 3
 
-        # small sleep so we don't use 100% CPU
-        time.sleep(0.01)
+        features = extractor.update(voltage)
+        if features is not None:
+            delta_v, noise_std = features
+
+            # queue this sample for the model: is this normal or strange?
+            now = time.time()
+            if not pending:
+                batch_started = now
+            feat_batch[len(pending)] = (voltage, delta_v, noise_std, temp)
+            pending.append((received - start_time, voltage, delta_v, noise_std, temp))
+            if len(pending) == SCORE_BATCH_SIZE or now - batch_started >= SCORE_FLUSH_TIMEOUT:
+                score_pending()
+
+    # don't lose the last few samples that were still waiting
+    if pending:
+        score_pending()
 
 except KeyboardInterrupt:
     print("\nStopped by user (Ctrl+C)")
+    if pending:
+        score_pending()
+
+finally:
+    # whatever happened, make sure everything written so far ends up on disk
+    if log_file is not None:
+        log_file.close()
+
+if logged_count:
+    print(f"\nSaved {logged_count} measurements to {LIVE_LOG_FILE}")
 
-# Save all measurements to a file
-if data_log:
-    pd.DataFrame(data_log).to_csv("live_monitoring_log.csv", index=False)
-    print(f"\nSaved {len(data_log)} measurements to live_monitoring_log.csv")
+reader.stop()
+dropped = reader.dropped - dropped_before
+if dropped:
+    print(f"Warning: {dropped} frames were dropped because the monitor fell behind")
 
 print("Program finished.")
 sock.close()
\ No newline at end of file
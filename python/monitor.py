@@ -3,27 +3,68 @@
 # why the AI thinks something is strange
 # and what we should do about it
 
-def explain_anomaly(voltage, delta_v, noise_std, temp, baseline):
+from collections import namedtuple
+
+# The limits explain_anomaly() checks against, worked out once after training
+Thresholds = namedtuple("Thresholds", ["min_voltage", "max_voltage", "min_delta", "max_delta",
+                                       "min_noise", "max_noise", "min_temp", "max_temp"])
+
+
+def make_thresholds(baseline, rule_model=None):
+    """
+    Turn the training statistics into plain numbers we can compare against directly.
+    With the rule model the limits are its own (mean ± z_limit * std per feature),
+    so every alert names exactly the feature(s) that caused it.
+    """
+    if rule_model is not None:
+        low, high = rule_model.limits()
+        return Thresholds(
+            min_voltage=float(low[0]), max_voltage=float(high[0]),
+            min_delta=float(low[1]), max_delta=float(high[1]),
+            min_noise=float(low[2]), max_noise=float(high[2]),
+            min_temp=float(low[3]), max_temp=float(high[3])
+        )
+
+    # Isolation Forest: it gives no reasons itself, so use simple rules from the training data
+    max_delta = float(3 * baseline["std_delta"])
+    return Thresholds(
+        min_voltage=float(baseline["min_voltage"]),
+        max_voltage=float("inf"),        # only low voltage is reported
+        min_delta=-max_delta,
+        max_delta=max_delta,
+        min_noise=float("-inf"),         # only growing noise is reported
+        max_noise=float(baseline["mean_noise"] + 3 * baseline["std_noise"]),
+        min_temp=float(baseline["min_temp"]),
+        max_temp=float(baseline["max_temp"])
+    )
+
+
+def explain_anomaly(voltage, delta_v, noise_std, temp, thresholds):
     """
     Try to give a human-readable reason why this point looks strange.
-    Uses simple rules based on what we learned during training.
+    Uses simple rules based on what we learned during training
+    (thresholds comes from make_thresholds).
     """
     reasons = []
 
     # Did the voltage jump a lot suddenly?
-    if abs(delta_v) > 3 * baseline["std_delta"]:
+    if delta_v < thresholds.min_delta or delta_v > thresholds.max_delta:
         reasons.append("Sudden voltage change")
 
-    # Is the signal becoming noisier than normal?
-    if noise_std > baseline["mean_noise"] + 3 * baseline["std_noise"]:
+    # Is the signal becoming noisier than normal - or suspiciously flat?
+    if noise_std > thresholds.max_noise:
         reasons.append("Noise growth detected")
+    elif noise_std < thresholds.min_noise:
+        reasons.append("Signal unusually flat")
 
-    # Is voltage lower than anything we saw during training?
-    if voltage < baseline["min_voltage"]:
+    # Is voltage outside what we saw during training?
+    if voltage < thresholds.min_voltage:
         reasons.append("Voltage below learned normal range")
+    elif voltage > thresholds.max_voltage:
+        reasons.append("Voltage above learned normal range")
 
     # Is temperature outside what we learned?
-    if temp < baseline["min_temp"] or temp > baseline["max_temp"]:
+    if temp < thresholds.min_temp or temp > thresholds.max_temp:
         reasons.append("Temperature out of normal range")
 
     # If we have no specific reason, just say it's unusual
@@ -42,6 +83,10 @@ def ai_recommendation(reason):
         return "Recommend derating (reduce power)"
     if "Voltage below" in reason:
         return "Recommend safe mode / stop high load"
+    if "Voltage above" in reason:
+        return "Check charger / voltage regulation"
     if "Temperature" in reason:
         return "Check cooling / thermal system"
+    if "flat" in reason:
+        return "Check sensor / wiring (signal may be stuck)"
     return "Monitor only - no clear action yet"
\ No newline at end of file
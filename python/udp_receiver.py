@@ -0,0 +1,166 @@
+# udp_receiver.py
+# This file reads many UDP packets with a single system call
+# On Linux we use recvmmsg(2) through ctypes, so a burst of CAN frames
+# costs one trip into the kernel instead of one per frame.
+# On other systems we fall back to one recvfrom_into() per call.
+# FrameReader runs the receiving in its own thread, so slow work in the
+# main loop (printing, the AI model) never keeps us from emptying the socket.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import socket
+import threading
+import time
+
+from can_parser import parse_can_frame
+
+MAX_BATCH = 32          # how many datagrams we can pull in one call
+FRAME_BUF_SIZE = 16     # our frames are 13 bytes, a little extra is enough
+
+MSG_TRUNC = 0x20        # kernel flag: datagram was bigger than our buffer
+MSG_WAITFORONE = 0x10000  # block for the first datagram only, then take what is queued
+WSAEMSGSIZE = 10040     # Windows error: datagram was bigger than our buffer
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    """Return the libc recvmmsg function, or None if this system has none."""
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return None
+    try:
+        func = ctypes.CDLL(libc_name, use_errno=True).recvmmsg
+    except AttributeError:
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint,
+                     ctypes.c_int, ctypes.c_void_p]
+    func.restype = ctypes.c_int
+    return func
+
+
+_recvmmsg = _load_recvmmsg()
+
+# Everything below is allocated once and reused for every call
+_buffers = [bytearray(FRAME_BUF_SIZE) for _ in range(MAX_BATCH)]
+_views = [memoryview(b) for b in _buffers]
+_c_buffers = [(ctypes.c_char * FRAME_BUF_SIZE).from_buffer(b) for b in _buffers]
+_iovecs = (_IOVec * MAX_BATCH)()
+_addrs = (ctypes.c_char * 16 * MAX_BATCH)()      # room for one sockaddr_in each
+_msgs = (_MMsgHdr * MAX_BATCH)()
+
+for _i in range(MAX_BATCH):
+    _iovecs[_i].iov_base = ctypes.addressof(_c_buffers[_i])
+    _iovecs[_i].iov_len = FRAME_BUF_SIZE
+    _msgs[_i].msg_hdr.msg_name = ctypes.addressof(_addrs[_i])
+    _msgs[_i].msg_hdr.msg_iov = ctypes.pointer(_iovecs[_i])
+    _msgs[_i].msg_hdr.msg_iovlen = 1
+
+
+def recv_batch(sock):
+    """
+    Wait for data on the socket and return every datagram that is ready
+    (up to MAX_BATCH) as a list of memoryviews.
+    Important: the memoryviews point into shared buffers, so they are only
+    valid until the next call - parse them right away.
+    Raises socket.timeout like recvfrom() if the socket has a timeout set.
+    """
+    if _recvmmsg is None:
+        # no recvmmsg: read one datagram into the first reusable buffer
+        try:
+            size, _ = sock.recvfrom_into(_buffers[0], FRAME_BUF_SIZE)
+        except OSError as err:
+            if getattr(err, "winerror", None) == WSAEMSGSIZE:
+                return []   # too big to be one of our frames
+            raise
+        return [_views[0][:size]]
+
+    # a socket with a timeout is non-blocking underneath, so wait here ourselves
+    timeout = sock.gettimeout()
+    if timeout is not None:
+        ready, _, _ = select.select([sock], [], [], timeout)
+        if not ready:
+            raise socket.timeout("timed out")
+
+    for i in range(MAX_BATCH):
+        _msgs[i].msg_hdr.msg_namelen = 16
+
+    count = _recvmmsg(sock.fileno(), _msgs, MAX_BATCH, MSG_WAITFORONE, None)
+    if count < 0:
+        err = ctypes.get_errno()
+        if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+            return []       # nothing there after all / interrupted (e.g. Ctrl+C)
+        raise OSError(err, os.strerror(err))
+
+    frames = []
+    for i in range(count):
+        if _msgs[i].msg_hdr.msg_flags & MSG_TRUNC:
+            continue        # too big to be one of our frames
+        frames.append(_views[i][:_msgs[i].msg_len])
+    return frames
+
+
+class FrameReader(threading.Thread):
+    """
+    Background thread: receive CAN frames, parse them and put
+    (received, can_id, voltage, temperature, status) tuples into frame_queue,
+    where received is the time.time() the frame was taken off the socket.
+    If the queue is full the newest frame is dropped and counted.
+    If receiving fails the thread ends and keeps the exception in .error.
+    """
+
+    def __init__(self, sock, frame_queue, poll_interval=0.2):
+        super().__init__(name="FrameReader", daemon=True)
+        self.sock = sock
+        self.frame_queue = frame_queue
+        self.dropped = 0
+        self.error = None
+        self._stop_event = threading.Event()
+        # wake up now and then so stop() is noticed even when the bus is quiet
+        self.sock.settimeout(poll_interval)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                frames = recv_batch(self.sock)
+            except socket.timeout:
+                continue
+            except OSError as err:
+                self.error = err    # e.g. socket was closed under us
+                break
+
+            received = time.time()  # one timestamp for the whole batch is close enough
+            for data in frames:
+                if len(data) != 13:
+                    continue  # skip bad packets
+                try:
+                    self.frame_queue.put_nowait((received,) + parse_can_frame(data))
+                except queue.Full:
+                    self.dropped += 1
+
+    def stop(self):
+        """Ask the thread to finish and wait until it has."""
+        self._stop_event.set()
+        self.join()